@@ -9,17 +9,71 @@ Powered by OpenRouter LLM API
 """
 
 import streamlit as st
+import asyncio
+import csv
+import functools
+import hashlib
+import html
+import logging
+import os
+import tempfile
+import threading
 import time
 from datetime import datetime
 from typing import Dict, List
+from itertools import chain, combinations
+from collections import OrderedDict, deque, namedtuple
+from types import MappingProxyType
 import re
 
+import numpy as np
+
+# Numba is optional: without it the batch rule engine uses NumPy masks
+try:
+    import numba
+    _HAS_NUMBA = True
+except ImportError:
+    _HAS_NUMBA = False
+
+# diskcache is optional: without it LLM replies are only memoized in memory
+try:
+    import diskcache
+    _HAS_DISKCACHE = True
+except ImportError:
+    _HAS_DISKCACHE = False
+
+# The OpenAI SDK (and its httpx transport) is optional: without it the
+# rule-based fallback is used for every decision
+try:
+    import httpx
+    from openai import OpenAI, AsyncOpenAI
+    _HAS_OPENAI = True
+except ImportError:
+    _HAS_OPENAI = False
+
 # ============================================================================
 # 🔑 API CONFIGURATION (EMBEDDED - NO UI EXPOSURE)
 # ============================================================================
 
 # LLM Backend Configuration
 USE_OLLAMA = False  # Set to True to use local Ollama, False to use OpenRouter
+LLM_EXPLAIN_MANDATORY = False  # Set to True to have the LLM explain zones fixed by safety rules
+
+# Set PUTAWAY_DEBUG=1 for debug logging, including full tracebacks for LLM errors
+_DEBUG = bool(os.environ.get('PUTAWAY_DEBUG'))
+
+# Console logging; LOG_LEVEL overrides the default (DEBUG with PUTAWAY_DEBUG, else WARNING)
+logger = logging.getLogger('putaway')
+if not logger.handlers:
+    _log_handler = logging.StreamHandler()
+    _log_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [putaway] %(message)s'))
+    logger.addHandler(_log_handler)
+    logger.propagate = False
+    try:
+        logger.setLevel(os.environ.get('LOG_LEVEL', 'DEBUG' if _DEBUG else 'WARNING').upper())
+    except ValueError:
+        logger.setLevel(logging.WARNING)
+        logger.warning("Unknown LOG_LEVEL %r, using WARNING", os.environ['LOG_LEVEL'])
 
 # Ollama Configuration
 OLLAMA_BASE_URL = "http://localhost:11434/v1"
@@ -29,11 +83,32 @@ OLLAMA_MODEL = "phi3:mini"  # The model you pulled from Ollama
 # Load API key from Streamlit secrets or environment variables
 OPENROUTER_API_KEY = st.secrets.get("OPENROUTER_API_KEY", "") if hasattr(st, 'secrets') else ""
 OPENROUTER_MODEL = "microsoft/phi-3-mini-128k-instruct"
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+# Max in-flight LLM requests for batch put-away (run_agent_batch)
+LLM_BATCH_CONCURRENCY = 8
+
+# Decoding: reasoning is 2-3 sentences (~80 tokens); temperature 0 keeps
+# replies deterministic, so identical prompts can be answered from the memo
+LLM_MAX_TOKENS = 160
+LLM_TEMPERATURE = 0
+LLM_MEMO_SIZE = 4096
+LLM_DECISION_TTL = 3600  # seconds a zone decision is reused for a matching item profile
+
+# Replies are also kept on disk (with diskcache installed), so they survive
+# server restarts; not used with Ollama, whose local model may change
+LLM_DISK_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'putaway_llm_cache')
+LLM_DISK_CACHE_SIZE = 2 ** 30  # bytes
+LLM_DISK_CACHE_TTL = 7 * 86400  # seconds
 
 # ============================================================================
 # CATEGORY INFERENCE RULES (INTELLIGENT DEFAULTS)
 # ============================================================================
 
+def _freeze(table: Dict) -> MappingProxyType:
+    """Read-only view of a master-data table and each of its records."""
+    return MappingProxyType({key: MappingProxyType(record) for key, record in table.items()})
+
 CATEGORY_RULES = {
     'Frozen Food': {
         'temp_default': 'frozen',
@@ -76,6 +151,7 @@ CATEGORY_RULES = {
         'description': 'Standard merchandise'
     }
 }
+CATEGORY_RULES = _freeze(CATEGORY_RULES)
 
 # ============================================================================
 # PAGE CONFIGURATION
@@ -144,6 +220,7 @@ ZONES = {
         'equipment': 'Heavy Forklift, Crane'
     }
 }
+ZONES = _freeze(ZONES)
 
 # ============================================================================
 # PRODUCT CATALOG (PREDEFINED PRODUCTS FOR QUICK SELECTION)
@@ -291,11 +368,41 @@ PRODUCT_CATALOG = {
         "turnover": "low"
     }
 }
+PRODUCT_CATALOG = _freeze(PRODUCT_CATALOG)
 
 # ============================================================================
 # INPUT VALIDATION & INFERENCE
 # ============================================================================
 
+# Selectbox options for the item input form, with value -> index lookups
+CATEGORY_OPTIONS = ("Electronics", "Frozen Food", "Chemicals", "Machinery",
+                    "Pharmaceuticals", "Textiles", "Automotive", "General Goods")
+HAZARD_OPTIONS = ("none", "flammable", "corrosive", "toxic", "explosive", "oxidizer")
+TEMP_OPTIONS = ("ambient", "cold", "frozen", "chilled", "controlled")
+TURNOVER_OPTIONS = ("low", "medium", "high")
+
+CATEGORY_IDX = {value: idx for idx, value in enumerate(CATEGORY_OPTIONS)}
+HAZARD_IDX = {value: idx for idx, value in enumerate(HAZARD_OPTIONS)}
+TEMP_IDX = {value: idx for idx, value in enumerate(TEMP_OPTIONS)}
+TURNOVER_IDX = {value: idx for idx, value in enumerate(TURNOVER_OPTIONS)}
+
+def _form_defaults(defaults) -> Dict:
+    """
+    Input-form defaults for a catalog record, with the selectbox index of
+    each default precomputed. Missing fields get the generic defaults, and
+    values missing from an option list fall back to its first option.
+    """
+    return {
+        'category_index': CATEGORY_IDX.get(defaults.get("category", "Electronics"), 0),
+        'weight': float(defaults.get("weight", 45.0)),
+        'hazard_index': HAZARD_IDX.get(defaults.get("hazard", "none"), 0),
+        'temp_index': TEMP_IDX.get(defaults.get("temp", "ambient"), 0),
+        'turnover_index': TURNOVER_IDX.get(defaults.get("turnover", "medium"), 0)
+    }
+
+# Built once at import; the input form looks its defaults up on every rerun
+_PRODUCT_DEFAULTS = _freeze({name: _form_defaults(record) for name, record in PRODUCT_CATALOG.items()})
+
 def validate_item_inputs(category: str, temperature_req: str, hazard_class: str) -> List[str]:
     """
     Validate item inputs and detect conflicts between category and selections.
@@ -325,64 +432,76 @@ def validate_item_inputs(category: str, temperature_req: str, hazard_class: str)
 # RULE ENGINE (SAFETY-FIRST ARCHITECTURE)
 # ============================================================================
 
-def apply_safety_rules(item: Dict) -> Dict:
+# Hazmat and cold-chain rejections never vary per item, so they are built once
+_HAZMAT_REJECTIONS = {
+    hazard: tuple(
+        {
+            'zone': z,
+            'reason': f"Not certified for {hazard} materials",
+            'regulation': 'OSHA 1910.106 / EPA 40 CFR'
+        }
+        for z in ['A', 'B', 'D', 'E']
+    )
+    for hazard in ['flammable', 'corrosive', 'toxic', 'explosive', 'oxidizer']
+}
+
+_COLD_REJECTIONS = tuple(
+    {
+        'zone': z,
+        'reason': 'No temperature control capability',
+        'regulation': 'FDA 21 CFR 110 / HACCP'
+    }
+    for z in ['A', 'C', 'D', 'E']
+)
+
+_ZONE_MAX_W = {z: ZONES[z]['max_weight'] for z in ZONES}
+
+_RulesResult = namedtuple('_RulesResult', ['eligible_zones', 'rejected_zones', 'safety_checks', 'mandatory_zone'])
+
+def _rules_result(weight: float, hazard_class: str, temperature_req: str, turnover_rate: str,
+                  eligible_zones, is_hazmat: bool, is_cold: bool) -> _RulesResult:
     """
-    Hard constraint enforcement BEFORE LLM.
-    Safety rules are non-negotiable.
+    Rejections and safety-check messages for RULES 1-4, given the eligible
+    zones and the hazmat / cold-chain flags. Shared by the scalar and batch
+    engines, which only differ in how they compute those.
     """
-    eligible_zones = list(ZONES.keys())
-    rejected_zones = []
     mandatory_zone = None
-    
+
     safety_checks = {
         'fire_safety': {'status': True, 'message': 'No hazardous materials detected'},
-        'weight_limit': {'status': True, 'message': f"Weight {item['weight']}kg within limits"},
+        'weight_limit': {'status': True, 'message': f"Weight {weight}kg within limits"},
         'temp_requirement': {'status': True, 'message': 'Ambient storage acceptable'},
         'dispatch_proximity': {'status': True, 'message': 'Standard dispatch routing'}
     }
-    
+
     # RULE 1: Hazardous Materials → Zone C (MANDATORY)
-    if item['hazard_class'] in ['flammable', 'corrosive', 'toxic', 'explosive', 'oxidizer']:
+    if is_hazmat:
         mandatory_zone = 'C'
-        eligible_zones = ['C']
         safety_checks['fire_safety'] = {
             'status': True, 
-            'message': f"HAZMAT protocol: {item['hazard_class'].upper()} routed to fire-safe zone"
+            'message': f"HAZMAT protocol: {hazard_class.upper()} routed to fire-safe zone"
         }
-        for z in ['A', 'B', 'D', 'E']:
-            rejected_zones.append({
-                'zone': z, 
-                'reason': f"Not certified for {item['hazard_class']} materials",
-                'regulation': 'OSHA 1910.106 / EPA 40 CFR'
-            })
-    
+        rejected_zones = _HAZMAT_REJECTIONS[hazard_class]
+
     # RULE 2: Cold Chain → Zone B (MANDATORY)
-    elif item['temperature_req'] in ['cold', 'frozen', 'chilled']:
+    elif is_cold:
         mandatory_zone = 'B'
-        eligible_zones = ['B']
         safety_checks['temp_requirement'] = {
             'status': True, 
-            'message': f"Cold chain required: {item['temperature_req'].upper()} storage activated"
+            'message': f"Cold chain required: {temperature_req.upper()} storage activated"
         }
-        for z in ['A', 'C', 'D', 'E']:
-            rejected_zones.append({
-                'zone': z, 
-                'reason': 'No temperature control capability',
-                'regulation': 'FDA 21 CFR 110 / HACCP'
-            })
-    
+        rejected_zones = _COLD_REJECTIONS
+
     # RULE 3: Weight Constraints
     else:
-        weight = item['weight']
-        for zone_id in list(eligible_zones):
-            max_w = ZONES[zone_id]['max_weight']
-            if weight > max_w:
-                eligible_zones.remove(zone_id)
-                rejected_zones.append({
-                    'zone': zone_id, 
-                    'reason': f"Exceeds {max_w}kg limit (item: {weight}kg)",
-                    'regulation': 'Rack capacity spec'
-                })
+        rejected_zones = tuple(
+            {
+                'zone': zone_id,
+                'reason': f"Exceeds {_ZONE_MAX_W[zone_id]}kg limit (item: {weight}kg)",
+                'regulation': 'Rack capacity spec'
+            }
+            for zone_id in ZONES if zone_id not in eligible_zones
+        )
         
         if weight > 500:
             safety_checks['weight_limit'] = {
@@ -391,224 +510,701 @@ def apply_safety_rules(item: Dict) -> Dict:
             }
     
     # RULE 4: High turnover preference
-    if item['turnover_rate'] == 'high' and 'D' in eligible_zones and item['weight'] < 50:
+    if turnover_rate == 'high' and 'D' in eligible_zones and weight < 50:
         safety_checks['dispatch_proximity'] = {
             'status': True, 
             'message': 'High-velocity SKU → fast-pick zone recommended'
         }
     
+    return _RulesResult(
+        eligible_zones=tuple(eligible_zones),
+        rejected_zones=rejected_zones,
+        safety_checks=tuple((key, check['status'], check['message']) for key, check in safety_checks.items()),
+        mandatory_zone=mandatory_zone
+    )
+
+def _rules_impl(weight: float, hazard_class: str, temperature_req: str, turnover_rate: str) -> _RulesResult:
+    """
+    Hard constraint enforcement BEFORE LLM.
+    Safety rules are non-negotiable.
+    """
+    is_hazmat = hazard_class in _HAZMAT_REJECTIONS
+    is_cold = not is_hazmat and temperature_req in ['cold', 'frozen', 'chilled']
+    if is_hazmat:
+        eligible_zones = ('C',)
+    elif is_cold:
+        eligible_zones = ('B',)
+    else:
+        eligible_zones = tuple(zone_id for zone_id in ZONES if _ZONE_MAX_W[zone_id] >= weight)
+    return _rules_result(weight, hazard_class, temperature_req, turnover_rate, eligible_zones, is_hazmat, is_cold)
+
+@st.cache_resource(show_spinner=False)
+def _rules_cache():
+    """
+    LRU cache over _rules_impl, shared across reruns and sessions.
+    The rules are pure, so repeat SKUs skip the rule engine entirely.
+    typed=True keeps 25 and 25.0 apart, since the weight is echoed in messages.
+    """
+    return functools.lru_cache(maxsize=4096, typed=True)(_rules_impl)
+
+# Looked up once per script run; the cache_resource lookup costs more than the rules
+_rules_cached = _rules_cache()
+
+def _rules_to_dict(rules: _RulesResult) -> Dict:
+    """Rules result as fresh, mutable containers."""
     return {
-        'eligible_zones': eligible_zones,
-        'rejected_zones': rejected_zones,
-        'safety_checks': safety_checks,
-        'mandatory_zone': mandatory_zone
+        'eligible_zones': list(rules.eligible_zones),
+        'rejected_zones': [dict(rejection) for rejection in rules.rejected_zones],
+        'safety_checks': {key: {'status': status, 'message': message} for key, status, message in rules.safety_checks},
+        'mandatory_zone': rules.mandatory_zone
     }
 
-# Template-based reasoning function removed - now using LLM-generated reasoning directly
+def apply_safety_rules(item: Dict) -> Dict:
+    """
+    Run the (cached) safety rules for an item.
+    Returns fresh containers, so callers are free to mutate the result.
+    """
+    return _rules_to_dict(_rules_cached(item['weight'], item['hazard_class'], item['temperature_req'], item['turnover_rate']))
+
+# Batch rule engine: a batch is converted to a structure of arrays (weights
+# plus categorical codes) so the rules run as a few mask ops over all items.
+# Unknown values map to code 0, which no rule matches.
+_HAZARD_CODES = {'none': 0, 'flammable': 1, 'corrosive': 2, 'toxic': 3, 'explosive': 4, 'oxidizer': 5}
+_TEMP_CODES = {'ambient': 0, 'controlled': 1, 'cold': 2, 'frozen': 3, 'chilled': 4}
+_COLD_CODES = np.array([_TEMP_CODES[t] for t in ('cold', 'frozen', 'chilled')], dtype=np.int8)
+
+_ZONE_IDS = tuple(ZONES)
+# float64, not float32: rounding must never push a weight under a rack limit
+_ZONE_MAX_W_ARR = np.array([_ZONE_MAX_W[z] for z in _ZONE_IDS], dtype=np.float64)
+_ZONE_COL = {z: col for col, z in enumerate(_ZONE_IDS)}
+
+def _items_to_soa(items: List[Dict]):
+    """
+    Structure-of-arrays view of a batch: (weights, hazard codes, temperature codes).
+    """
+    n = len(items)
+    weights = np.fromiter((item['weight'] for item in items), dtype=np.float64, count=n)
+    hazard = np.fromiter((_HAZARD_CODES.get(item['hazard_class'], 0) for item in items), dtype=np.int8, count=n)
+    temp = np.fromiter((_TEMP_CODES.get(item['temperature_req'], 0) for item in items), dtype=np.int8, count=n)
+    return weights, hazard, temp
+
+@st.cache_resource(show_spinner=False)
+def _rules_kernel():
+    """
+    Numba kernel filling the (N, zones) eligibility matrix, or None without numba.
+    Compiled and warmed up once per process, so batches never pay the JIT latency.
+    """
+    if not _HAS_NUMBA:
+        return None
+
+    # Prefer OpenMP: it is threadsafe for concurrent sessions, and TBB can
+    # hang the interpreter on shutdown
+    numba.config.THREADING_LAYER_PRIORITY = ['omp', 'tbb', 'workqueue']
+
+    @numba.njit(parallel=True)
+    def kernel(weights, is_hazmat, is_cold, max_w, hazmat_col, cold_col, out):
+        for i in numba.prange(weights.shape[0]):
+            for z in range(max_w.shape[0]):
+                if is_hazmat[i]:
+                    out[i, z] = z == hazmat_col
+                elif is_cold[i]:
+                    out[i, z] = z == cold_col
+                else:
+                    out[i, z] = weights[i] <= max_w[z]
+
+    kernel(np.zeros(1), np.zeros(1, dtype=np.bool_), np.zeros(1, dtype=np.bool_),
+           _ZONE_MAX_W_ARR, 0, 0, np.zeros((1, len(_ZONE_IDS)), dtype=np.bool_))
+    return kernel
+
+# JIT-compile at startup rather than on the first batch
+_rules_kernel()
+
+def _rules_masks(weights: np.ndarray, hazard: np.ndarray, temp: np.ndarray):
+    """
+    Vectorized RULES 1-3: returns the (N, zones) eligibility matrix and the
+    hazmat / cold-chain masks.
+    """
+    is_hazmat = hazard > 0
+    is_cold = np.isin(temp, _COLD_CODES) & ~is_hazmat
+    kernel = _rules_kernel()
+    if kernel is not None:
+        eligible = np.zeros((len(weights), len(_ZONE_IDS)), dtype=np.bool_)
+        kernel(weights, is_hazmat, is_cold, _ZONE_MAX_W_ARR, _ZONE_COL['C'], _ZONE_COL['B'], eligible)
+    else:
+        weight_ok = weights[:, None] <= _ZONE_MAX_W_ARR[None, :]
+        eligible = weight_ok & ~(is_hazmat | is_cold)[:, None]
+        eligible[is_hazmat, _ZONE_COL['C']] = True
+        eligible[is_cold, _ZONE_COL['B']] = True
+    return eligible, is_hazmat, is_cold
+
+def apply_safety_rules_batch(items: List[Dict]) -> List[Dict]:
+    """
+    apply_safety_rules for a whole batch, vectorized with NumPy.
+    Results are converted back to per-item dicts only at the boundary.
+    """
+    if not items:
+        return []
+    eligible, is_hazmat, is_cold = _rules_masks(*_items_to_soa(items))
+    return [
+        _rules_to_dict(_rules_result(
+            item['weight'], item['hazard_class'], item['temperature_req'], item['turnover_rate'],
+            tuple(zone_id for zone_id, ok in zip(_ZONE_IDS, row) if ok), hazmat, cold
+        ))
+        for item, row, hazmat, cold in zip(items, eligible.tolist(), is_hazmat.tolist(), is_cold.tolist())
+    ]
 
 # ============================================================================
-# LLM CALL (OPENROUTER)
+# MANDATORY ZONE REASONING (TEMPLATES)
 # ============================================================================
 
-def call_llm(item: Dict, eligible_zones: List[str]) -> Dict:
+# Safety rules already fix the zone for hazmat and cold-chain items, so unless
+# LLM_EXPLAIN_MANDATORY is set their reasoning comes from these templates
+_HAZMAT_TEMPLATES = {
+    'flammable': "{product_name} is classified as flammable, so it must be stored in Zone {zone} ({zone_name}) under {regulation}. "
+                 "The zone's fire-safe construction and {rack_type} isolate ignition risks from general inventory, "
+                 "and the {equipment} allows the {weight}kg load to be handled without spark sources.",
+    'corrosive': "{product_name} is classified as corrosive, so it must be stored in Zone {zone} ({zone_name}) under {regulation}. "
+                 "The {rack_type} captures leaks and spills before they can damage stock or structures, "
+                 "and the {equipment} supports safe handling of the {weight}kg load.",
+    'toxic': "{product_name} is classified as toxic, so it must be stored in Zone {zone} ({zone_name}) under {regulation}. "
+             "Segregating it in the {rack_type} keeps exposure away from general storage and pick areas, "
+             "and the {equipment} is rated for handling the {weight}kg load safely.",
+    'explosive': "{product_name} is classified as explosive, so it must be stored in Zone {zone} ({zone_name}) under {regulation}. "
+                 "The zone's fire-safe construction and {rack_type} contain any incident, "
+                 "and the {equipment} removes ignition sources while moving the {weight}kg load.",
+    'oxidizer': "{product_name} is classified as an oxidizer, so it must be stored in Zone {zone} ({zone_name}) under {regulation}. "
+                "Keeping it in the fire-safe {rack_type} separates it from combustible goods whose fires it could intensify, "
+                "and the {equipment} supports safe handling of the {weight}kg load."
+}
+
+_COLD_CHAIN_TEMPLATES = {
+    'cold': "{product_name} requires cold storage, so it must be stored in Zone {zone} ({zone_name}) under {regulation}. "
+            "The zone holds {temp_range} to protect product integrity, "
+            "and the {equipment} keeps the {weight}kg load within the cold chain during handling.",
+    'frozen': "{product_name} must stay frozen, so it must be stored in Zone {zone} ({zone_name}) under {regulation}. "
+              "The zone holds {temp_range}, preventing thaw-refreeze cycles that compromise quality and safety, "
+              "and the {rack_type} with {equipment} keeps the {weight}kg load inside the cold chain.",
+    'chilled': "{product_name} requires chilled storage, so it must be stored in Zone {zone} ({zone_name}) under {regulation}. "
+               "The zone's {temp_range} refrigerated environment keeps the product within its safe temperature band, "
+               "and the {equipment} keeps the {weight}kg load inside the cold chain."
+}
+
+def _mandatory_reasoning(item: Dict, zone: str) -> Dict:
     """
-    Call OpenRouter API for intelligent zone selection with detailed reasoning.
-    Falls back to rule-based if API unavailable.
+    Templated explanation for a zone fixed by the safety rules.
+    Returns a call_llm-style result without any API round-trip.
     """
+    zone_info = ZONES[zone]
+    if item['hazard_class'] in _HAZMAT_TEMPLATES:
+        template = _HAZMAT_TEMPLATES[item['hazard_class']]
+        regulation = 'OSHA 1910.106 / EPA 40 CFR'
+    else:
+        template = _COLD_CHAIN_TEMPLATES[item['temperature_req']]
+        regulation = 'FDA 21 CFR 110 / HACCP'
+
+    reasoning = template.format(
+        product_name=item['product_name'],
+        weight=item['weight'],
+        zone=zone,
+        zone_name=zone_info['name'],
+        rack_type=zone_info['rack_type'],
+        equipment=zone_info['equipment'],
+        temp_range=zone_info['temp_range'],
+        regulation=regulation
+    )
 
-    print(f"\n[LLM] call_llm() invoked for item: {item.get('product_name', 'Unknown')}")
-    print(f"   Eligible zones: {eligible_zones}")
+    return {
+        'zone': zone,
+        'confidence': 'high',
+        'reasoning': reasoning,
+        'decision_time': 0.0,
+        'success': True
+    }
 
-    # Determine which LLM backend to use
-    if USE_OLLAMA:
-        print(f"   [OLLAMA] Using Ollama (local) - Model: {OLLAMA_MODEL}")
-    else:
-        print(f"   [OPENROUTER] Using OpenRouter - API Key configured: {bool(OPENROUTER_API_KEY)}")
+# ============================================================================
+# LLM CALL (OPENROUTER)
+# ============================================================================
 
-    try:
-        from openai import OpenAI
-
-        # Initialize client based on backend selection
-        if USE_OLLAMA:
-            print(f"   [INIT] Initializing Ollama client at {OLLAMA_BASE_URL}...")
-            client = OpenAI(
-                base_url=OLLAMA_BASE_URL,
-                api_key="ollama"  # Ollama doesn't need real API key but OpenAI client requires one
-            )
-            model = OLLAMA_MODEL
-        else:
-            # Check if OpenRouter API key is configured
-            if not OPENROUTER_API_KEY or OPENROUTER_API_KEY == "sk-or-v1-your-api-key-here":
-                print("   [WARNING] OpenRouter API key not configured - using fallback")
-                return rule_based_selection(item, eligible_zones)
-
-            print(f"   [INIT] Initializing OpenRouter client...")
-            client = OpenAI(
-                base_url="https://openrouter.ai/api/v1",
-                api_key=OPENROUTER_API_KEY
-            )
-            model = OPENROUTER_MODEL
-
-        print("   [SUCCESS] Client initialized")
-
-        # Build detailed zone descriptions
-        zones_desc = "\n".join([
-            f"Zone {z}: {ZONES[z]['name']}\n"
-            f"  - Type: {ZONES[z]['type']}\n"
-            f"  - Max Weight: {ZONES[z]['max_weight']}kg\n"
-            f"  - Temperature: {ZONES[z]['temp_range']}\n"
-            f"  - Rack: {ZONES[z]['rack_type']}\n"
-            f"  - Equipment: {ZONES[z]['equipment']}\n"
-            f"  - Dispatch Distance: {ZONES[z]['dispatch_distance']}m\n"
-            for z in eligible_zones
-        ])
-
-        # Check if only one zone available (mandatory assignment)
-        if len(eligible_zones) == 1:
-            prompt = f"""You are an expert warehouse management AI agent. Explain why this item MUST be stored in the designated zone.
-
-INCOMING ITEM DETAILS:
-- Product Name: {item['product_name']}
-- Category: {item['category']}
-- Weight: {item['weight']}kg
-- Hazard Classification: {item['hazard_class']}
-- Temperature Requirement: {item['temperature_req']}
-- Turnover Rate: {item['turnover_rate']}
-
-DESIGNATED ZONE:
-{zones_desc}
+def _describe_zones(zone_ids) -> str:
+    """Render the compact prompt line for each zone in a set."""
+    return "\n".join(
+        f"{z}:{ZONES[z]['name']}|{ZONES[z]['max_weight']}kg|d={ZONES[z]['dispatch_distance']}m|{ZONES[z]['rack_type']}"
+        for z in zone_ids
+    )
+
+# ZONES is static, so every eligible-zone subset (31 of them) is rendered once
+_ZONES_DESC_CACHE = {
+    frozenset(combo): _describe_zones(combo)
+    for combo in chain.from_iterable(combinations(ZONES, r) for r in range(1, len(ZONES) + 1))
+}
+
+# Prompts are kept terse: input tokens drive both LLM latency and cost.
+# Zone type, temperature and equipment are implied by the zone name and rack.
+_SYSTEM_PROMPT = "You are a warehouse put-away expert."
+
+_ZONES_LEGEND = "id:name|max weight|d=dispatch distance|rack"
+
+_PROMPT_ITEM = "{product_name} | {category} | {weight}kg | hazard={hazard_class} | temp={temperature_req} | turnover={turnover_rate}"
 
-This zone assignment is MANDATORY due to safety regulations. Explain in 2-3 detailed sentences WHY this specific item requires this zone, referencing the item's properties and the zone's specialized capabilities.
+_PROMPT_MANDATORY = """Safety rules REQUIRE this item to be stored in the zone below. Explain why.
 
-Respond in this EXACT format:
+ITEM: """ + _PROMPT_ITEM + """
 
-ZONE: {eligible_zones[0]}
+ZONE (""" + _ZONES_LEGEND + """):
+{zones_desc}
+
+Reply in this exact format:
+ZONE: {zone}
 CONFIDENCE: high
-REASONING: [Provide detailed explanation about why this item's specific characteristics (hazard class, temperature needs, weight, etc.) require this zone's specialized features (temperature control, fire safety, equipment, etc.). Be specific and technical.]"""
-        else:
-            prompt = f"""You are an expert warehouse management AI agent. Your task is to select the optimal storage zone for an incoming item and provide detailed reasoning.
+REASONING: <2-3 technical sentences linking the item's hazard, temperature and weight to this zone's capabilities>"""
 
-INCOMING ITEM DETAILS:
-- Product Name: {item['product_name']}
-- Category: {item['category']}
-- Weight: {item['weight']}kg
-- Hazard Classification: {item['hazard_class']}
-- Temperature Requirement: {item['temperature_req']}
-- Turnover Rate: {item['turnover_rate']}
+_PROMPT_MULTI = """Pick the best storage zone for this item, weighing safety, pick efficiency, rack fit and handling.
 
-AVAILABLE ZONES (after safety filtering):
+ITEM: """ + _PROMPT_ITEM + """
+
+ZONES (""" + _ZONES_LEGEND + """):
 {zones_desc}
 
-DECISION CRITERIA:
-1. Safety compliance (hazmat regulations, weight limits, temperature control)
-2. Operational efficiency (pick time, dispatch distance)
-3. Space utilization (rack type compatibility)
-4. Equipment availability (handling requirements)
+Reply in this exact format:
+ZONE: <one letter from ZONES>
+CONFIDENCE: <high|medium|low>
+REASONING: <2-3 sentences on why this zone fits the item's weight and turnover, citing rack type or dispatch distance>"""
+
+_PROMPT_BATCH = """Pick the best storage zone for EACH item, weighing safety, pick efficiency, rack fit and handling.
 
-Provide your recommendation in this EXACT format:
+ITEMS:
+{items_desc}
 
-ZONE: [single letter A-E from available zones]
-CONFIDENCE: [high/medium/low]
-REASONING: [Provide 2-3 sentences explaining why this zone is optimal for this specific item, considering its weight, turnover rate, handling requirements, and operational benefits. Reference specific zone characteristics like rack type, equipment, or dispatch distance.]"""
+ZONES (""" + _ZONES_LEGEND + """), shared by all items:
+{zones_desc}
 
-        print(f"   [API] Calling LLM API: {model}")
-        start = time.time()
+Reply with one block per item, in order, in this exact format:
+ITEM <n>:
+ZONE: <one letter from ZONES>
+CONFIDENCE: <high|medium|low>
+REASONING: <2-3 sentences on why this zone fits the item's weight and turnover, citing rack type or dispatch distance>"""
+
+_PROMPT_BATCH_ITEM = "ITEM {n}: " + _PROMPT_ITEM
+
+# Parser for packed multi-item replies, compiled once
+_RE_BATCH_ITEM = re.compile(
+    r'ITEM\s+(\d+):\s*ZONE:\s*([A-E])\s*CONFIDENCE:\s*(high|medium|low)\s*REASONING:\s*(.+?)(?=ITEM\s+\d+:|\Z)',
+    re.IGNORECASE | re.DOTALL
+)
+
+# Items packed into one batch prompt: at most this many, and the prompt is
+# kept under the token budget (estimated at ~4 characters per token)
+LLM_PACK_MAX_ITEMS = 8
+LLM_PACK_PROMPT_TOKENS = 3000
+
+@st.cache_resource(show_spinner=False)
+def _get_client(base_url: str, api_key: str):
+    """
+    Shared OpenAI-compatible client, built once per backend and reused
+    across reruns and sessions so keep-alive connections stay warm.
+    """
+    logger.info("Creating LLM client for %s", base_url)
+    return OpenAI(
+        base_url=base_url,
+        api_key=api_key,
+        http_client=httpx.Client(
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+            timeout=30.0
+        )
+    )
+
+def _llm_backend():
+    """
+    Resolve (base_url, api_key, model) for the configured LLM backend.
+    Returns None when no LLM can be called, so callers use the rule-based fallback.
+    """
+    if not _HAS_OPENAI:
+        logger.warning("openai package not installed - using fallback")
+        return None
+    if USE_OLLAMA:
+        # Ollama doesn't need real API key but OpenAI client requires one
+        return OLLAMA_BASE_URL, "ollama", OLLAMA_MODEL
+    if not OPENROUTER_API_KEY or OPENROUTER_API_KEY == "sk-or-v1-your-api-key-here":
+        logger.warning("OpenRouter API key not configured - using fallback")
+        return None
+    return OPENROUTER_BASE_URL, OPENROUTER_API_KEY, OPENROUTER_MODEL
+
+def _build_messages(item: Dict, eligible_zones: List[str]) -> List[Dict]:
+    """
+    Chat messages for a single-item zone decision.
+    """
+    if not eligible_zones:
+        raise ValueError("no zone passes the safety rules for this item")
+
+    # Zone descriptions and prompt skeletons are precomputed at import time
+    zones_desc = _ZONES_DESC_CACHE[frozenset(eligible_zones)]
+
+    # Check if only one zone available (mandatory assignment)
+    if len(eligible_zones) == 1:
+        prompt = _PROMPT_MANDATORY.format(**item, zones_desc=zones_desc, zone=eligible_zones[0])
+    else:
+        prompt = _PROMPT_MULTI.format(**item, zones_desc=zones_desc)
+
+    return [
+        {"role": "system", "content": _SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+def _prompt_key(model: str, messages: List[Dict]) -> str:
+    """Digest identifying a (model, prompt) pair."""
+    raw = model + "|" + "\n".join(m["content"] for m in messages)
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+def _is_usable_reply(text) -> bool:
+    """Whether a reply has enough content to parse (and to memoize)."""
+    return bool(text) and len(text.strip()) >= 10
+
+class _Memo:
+    """
+    Thread-safe LRU memo with entries expiring after ttl seconds, optionally
+    backed by a disk cache that is shared across processes and restarts.
+    Holds raw LLM replies (keyed on _prompt_key) and agent zone decisions
+    (keyed on _decision_key).
+    """
+
+    def __init__(self, maxsize: int, ttl: float, disk=None):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._replies = OrderedDict()  # key -> (expiry, value)
+        self._lock = threading.Lock()
+        self._disk = disk
+
+    def get(self, key: str):
+        text = None
+        with self._lock:
+            entry = self._replies.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._replies.move_to_end(key)
+                    return entry[1]
+                del self._replies[key]
+        if self._disk is not None:
+            try:
+                text = self._disk.get(key)
+            except Exception as e:  # e.g. sqlite3.OperationalError on a locked db
+                logger.warning("LLM disk cache read failed (%s)", e)
+            if text is not None:
+                self._remember(key, text)
+        return text
+
+    def put(self, key: str, text: str):
+        self._remember(key, text)
+        if self._disk is not None:
+            try:
+                self._disk.set(key, text, expire=self._ttl)
+            except Exception as e:
+                logger.warning("LLM disk cache write failed (%s)", e)
+
+    def clear(self):
+        with self._lock:
+            self._replies.clear()
+        if self._disk is not None:
+            try:
+                self._disk.clear()
+            except Exception as e:
+                logger.warning("LLM disk cache clear failed (%s)", e)
+
+    def _remember(self, key: str, text: str):
+        with self._lock:
+            self._replies[key] = (time.monotonic() + self._ttl, text)
+            self._replies.move_to_end(key)
+            if len(self._replies) > self._maxsize:
+                self._replies.popitem(last=False)
+
+@st.cache_resource(show_spinner=False)
+def _reply_memo() -> _Memo:
+    """Process-wide reply memo, kept across reruns and sessions."""
+    disk = None
+    if _HAS_DISKCACHE and not USE_OLLAMA:
+        try:
+            disk = diskcache.Cache(LLM_DISK_CACHE_DIR, size_limit=LLM_DISK_CACHE_SIZE)
+        except Exception as e:  # OSError, or sqlite3 errors from a locked/corrupt db
+            logger.warning("LLM disk cache unavailable (%s) - memoizing in memory only", e)
+    return _Memo(LLM_MEMO_SIZE, LLM_DISK_CACHE_TTL, disk)
+
+def _complete(client, model: str, messages: List[Dict], max_tokens: int, on_token=None) -> str:
+    """
+    Chat completion text for the messages; identical prompts are answered
+    from the in-process memo without a network call.
+    With on_token, the reply is streamed and each text delta passed to it.
+    """
+    key = _prompt_key(model, messages)
+    text = _reply_memo().get(key)
+    if text is not None:
+        logger.debug("Reply served from memo (%s)", key)
+        return text
+
+    if on_token is None:
         response = client.chat.completions.create(
             model=model,
-            messages=[
-                {"role": "system", "content": "You are a warehouse optimization expert. Provide zone recommendations with detailed reasoning."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=500
+            messages=messages,
+            temperature=LLM_TEMPERATURE,
+            max_tokens=max_tokens
         )
-        decision_time = time.time() - start
-        print(f"   [TIMING] API responded in {decision_time:.2f}s")
-
-        # Debug: Check response structure
-        print(f"   Response type: {type(response)}")
-        print(f"   Has choices: {hasattr(response, 'choices')}")
-        print(f"   Choices length: {len(response.choices) if hasattr(response, 'choices') else 0}")
-
-        if response.choices and len(response.choices) > 0:
-            print(f"   First choice: {response.choices[0]}")
-            print(f"   Message: {response.choices[0].message}")
-            text = response.choices[0].message.content
-            print(f"   Content type: {type(text)}")
-            print(f"   Content length: {len(text) if text else 0}")
-        else:
-            text = ""
-
-        # Debug: Print raw LLM response
-        print(f"\n=== LLM RAW RESPONSE ===\n{text}\n========================\n")
-
-        # Validate response is not empty
-        if not text or len(text.strip()) < 10:
-            print("   [WARNING] LLM returned empty or very short response - returning error")
-            return {
-                'zone': None,
-                'confidence': 'low',
-                'reasoning': None,
-                'decision_time': time.time() - start,
-                'success': False,
-                'error': 'LLM returned empty or invalid response. Please try again.'
-            }
+        text = response.choices[0].message.content if response.choices else ""
+    else:
+        stream = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=LLM_TEMPERATURE,
+            max_tokens=max_tokens,
+            stream=True
+        )
+        parts = []
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                on_token(delta)
+        text = ''.join(parts)
+    logger.debug("Reply length: %s", len(text) if text else 0)
+
+    if _is_usable_reply(text):
+        _reply_memo().put(key, text)
+    return text
+
+async def _complete_async(client, model: str, messages: List[Dict], max_tokens: int) -> str:
+    """
+    Async counterpart of _complete, sharing the same reply memo.
+    """
+    key = _prompt_key(model, messages)
+    text = _reply_memo().get(key)
+    if text is not None:
+        logger.debug("Reply served from memo (%s)", key)
+        return text
+
+    response = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=LLM_TEMPERATURE,
+        max_tokens=max_tokens
+    )
+    text = response.choices[0].message.content if response.choices else ""
 
-        # Parse zone
-        zone_match = re.search(r'ZONE:\s*([A-E])', text, re.IGNORECASE)
-        zone = zone_match.group(1).upper() if zone_match else eligible_zones[0]
+    if _is_usable_reply(text):
+        _reply_memo().put(key, text)
+    return text
 
-        if zone not in eligible_zones:
-            zone = eligible_zones[0]
+def _pick_zone(value: str):
+    """Zone letter at the start of a ZONE: value, if it is A-E."""
+    letter = value[:1].upper()
+    return letter if letter in ('A', 'B', 'C', 'D', 'E') else None
 
-        # Parse confidence
-        conf_match = re.search(r'CONFIDENCE:\s*(high|medium|low)', text, re.IGNORECASE)
-        confidence = conf_match.group(1).lower() if conf_match else 'medium'
+def _pick_confidence(value: str):
+    """Confidence level at the start of a CONFIDENCE: value."""
+    value = value.lower()
+    return next((level for level in ('high', 'medium', 'low') if value.startswith(level)), None)
 
-        # Parse reasoning
-        reasoning_match = re.search(r'REASONING:\s*(.+?)(?:\n\n|\Z)', text, re.IGNORECASE | re.DOTALL)
-        reasoning = reasoning_match.group(1).strip() if reasoning_match else text
+class _ReplyParser:
+    """
+    Line-by-line state machine for the ZONE / CONFIDENCE / REASONING fields,
+    so a streamed reply can be parsed as it arrives. Labels are found
+    anywhere in a line, and a value may follow on a later line; reasoning
+    runs from its label to the next blank line.
+    """
 
-        # Clean up reasoning (remove extra whitespace)
-        reasoning = ' '.join(reasoning.split())
+    def __init__(self):
+        self.zone = None
+        self.confidence = None
+        self.reasoning_lines = None  # stays None until the REASONING: label is seen
+        self._in_reasoning = False
+        self._pending = set()  # labels that ended a line, value still to come
+        self._partial = ''  # streamed text after the last newline
+
+    def feed(self, chunk: str):
+        """Consume streamed text; complete lines are parsed immediately."""
+        *lines, self._partial = (self._partial + chunk).split('\n')
+        for line in lines:
+            self.feed_line(line)
+
+    def feed_line(self, line: str):
+        if self._in_reasoning:
+            if not line.rstrip('\r'):
+                # A blank line ends the reasoning once it has started
+                self._in_reasoning = not self.reasoning_lines
+            elif self.reasoning_lines or line.strip():
+                self.reasoning_lines.append(line)
+
+        if self.zone is None:
+            self.zone = self._scan(line, 'ZONE:', _pick_zone)
+        if self.confidence is None:
+            self.confidence = self._scan(line, 'CONFIDENCE:', _pick_confidence)
+        if self.reasoning_lines is None:
+            i = line.upper().find('REASONING:')
+            if i >= 0:
+                first = line[i + 10:].strip()
+                self.reasoning_lines = [first] if first else []
+                self._in_reasoning = True
+
+    def _scan(self, line: str, label: str, pick):
+        """
+        First value pick() accepts after an occurrence of label, or None.
+        A label with nothing after it on the line stays pending, and the
+        next non-blank line is tried as its value.
+        """
+        if label in self._pending:
+            if not line.strip():
+                return None
+            self._pending.discard(label)
+            value = pick(line.lstrip())
+            if value:
+                return value
+        upper = line.upper()
+        i = upper.find(label)
+        while i >= 0:
+            rest = line[i + len(label):].lstrip()
+            if not rest:
+                self._pending.add(label)
+                return None
+            value = pick(rest)
+            if value:
+                return value
+            i = upper.find(label, i + len(label))
+        return None
+
+    def reasoning_so_far(self) -> str:
+        """Reasoning received so far, including a line that is still streaming."""
+        lines = list(self.reasoning_lines or [])
+        partial = self._partial.lstrip()
+        if self._in_reasoning:
+            lines.append(partial)
+        elif self.reasoning_lines is None and 'REASONING:' in partial.upper():
+            lines.append(partial[partial.upper().index('REASONING:') + 10:])
+        return ' '.join(' '.join(lines).split())
+
+def _parse_llm_response(text: str, eligible_zones: List[str]):
+    """
+    Single pass over the reply's lines for the ZONE / CONFIDENCE / REASONING
+    fields (see _ReplyParser). Returns (zone, confidence, reasoning); defaults
+    are the first eligible zone, 'medium' confidence and the whole reply as
+    reasoning.
+    """
+    parser = _ReplyParser()
+    for line in text.splitlines():
+        parser.feed_line(line)
 
-        # Debug: Print parsed reasoning
-        print(f"=== PARSED REASONING ===\n{reasoning}\n========================\n")
+    zone = parser.zone if parser.zone in eligible_zones else eligible_zones[0]
+    if parser.zone and parser.zone != zone:
+        logger.warning("LLM named ineligible zone %s - using %s", parser.zone, zone)
 
-        return {
-            'zone': zone,
-            'confidence': confidence,
-            'reasoning': reasoning,
-            'decision_time': decision_time,
-            'success': True,
-            'llm_backend': 'Ollama (phi3:mini)' if USE_OLLAMA else 'OpenRouter (Mistral-7B)',
-            'llm_model': model
-        }
+    # Clean up reasoning (remove extra whitespace)
+    reasoning = ' '.join(' '.join(parser.reasoning_lines or [text]).split())
+    return zone, parser.confidence or 'medium', reasoning
 
-    except Exception as e:
-        # Log error for debugging
-        print(f"\n[ERROR] LLM Error occurred!")
-        print(f"   Error type: {type(e).__name__}")
-        print(f"   Error message: {str(e)}")
-        import traceback
-        print(f"   Traceback:\n{traceback.format_exc()}")
-
-        # Return error instead of fallback
+def _parse_llm_text(text: str, eligible_zones: List[str], decision_time: float, model: str) -> Dict:
+    """
+    Turn raw LLM output into a zone decision dict.
+    """
+    logger.debug("LLM raw response:\n%s", text)
+
+    # Validate response is not empty
+    if not _is_usable_reply(text):
+        logger.warning("LLM returned empty or very short response - returning error")
         return {
             'zone': None,
             'confidence': 'low',
             'reasoning': None,
-            'decision_time': 0,
+            'decision_time': decision_time,
             'success': False,
-            'error': f'API Error: {type(e).__name__} - {str(e)}'
+            'error': 'LLM returned empty or invalid response. Please try again.'
         }
 
+    zone, confidence, reasoning = _parse_llm_response(text, eligible_zones)
+
+    logger.debug("Parsed reasoning: %s", reasoning)
+
+    return {
+        'zone': zone,
+        'confidence': confidence,
+        'reasoning': reasoning,
+        'decision_time': decision_time,
+        'success': True,
+        'llm_backend': 'Ollama (phi3:mini)' if USE_OLLAMA else 'OpenRouter (Mistral-7B)',
+        'llm_model': model
+    }
+
+def _llm_error(e: Exception) -> Dict:
+    """
+    Log an LLM failure and build the error result surfaced to the UI.
+    """
+    # The traceback is only formatted in debug mode
+    logger.error("LLM error: %s - %s", type(e).__name__, e, exc_info=_DEBUG)
+
+    # Return error instead of fallback
+    return {
+        'zone': None,
+        'confidence': 'low',
+        'reasoning': None,
+        'decision_time': 0,
+        'success': False,
+        'error': f'API Error: {type(e).__name__} - {str(e)}'
+    }
+
+def call_llm(item: Dict, eligible_zones: List[str], on_token=None) -> Dict:
+    """
+    Call OpenRouter API for intelligent zone selection with detailed reasoning.
+    Falls back to rule-based if API unavailable.
+    With on_token, the reply is streamed to it as it arrives (see _complete).
+    """
+
+    logger.debug("call_llm() invoked for item: %s, eligible zones: %s", item.get('product_name', 'Unknown'), eligible_zones)
+
+    # Determine which LLM backend to use
+    if USE_OLLAMA:
+        logger.debug("Using Ollama (local) - Model: %s", OLLAMA_MODEL)
+    else:
+        logger.debug("Using OpenRouter - API Key configured: %s", bool(OPENROUTER_API_KEY))
+
+    try:
+        backend = _llm_backend()
+        if backend is None:
+            return rule_based_selection(item, eligible_zones)
+
+        base_url, api_key, model = backend
+        client = _get_client(base_url, api_key)
+
+        messages = _build_messages(item, eligible_zones)
+
+        logger.debug("Calling LLM API: %s at %s", model, base_url)
+        start = time.perf_counter()
+        text = _complete(client, model, messages, LLM_MAX_TOKENS, on_token)
+        decision_time = time.perf_counter() - start
+        logger.info("LLM replied in %.2fs", decision_time)
+
+        return _parse_llm_text(text, eligible_zones, decision_time, model)
+
+    except Exception as e:
+        return _llm_error(e)
+
+async def _call_llm_async(client, model: str, item: Dict, eligible_zones: List[str],
+                          semaphore: asyncio.Semaphore) -> Dict:
+    """
+    Async counterpart of call_llm used by run_agent_batch.
+    """
+    try:
+        messages = _build_messages(item, eligible_zones)
+        async with semaphore:
+            start = time.perf_counter()
+            text = await _complete_async(client, model, messages, LLM_MAX_TOKENS)
+            decision_time = time.perf_counter() - start
+        logger.info("%s: LLM replied in %.2fs", item.get('product_name', 'Unknown'), decision_time)
+
+        return _parse_llm_text(text, eligible_zones, decision_time, model)
+
+    except Exception as e:
+        return _llm_error(e)
+
 def rule_based_selection(item: Dict, eligible_zones: List[str]) -> Dict:
     """
     Intelligent fallback when LLM unavailable.
     Generates rule-based reasoning instead of templates.
     """
-    print("   [FALLBACK] Using rule-based fallback selection")
+    logger.info("Using rule-based fallback selection")
     weight = item['weight']
     turnover = item['turnover_rate']
     category = item['category']
@@ -640,347 +1236,425 @@ def rule_based_selection(item: Dict, eligible_zones: List[str]) -> Dict:
         'success': True
     }
 
+def _pack_chunks(indices: List[int], item_blocks: Dict[int, str], base_len: int) -> List[List[int]]:
+    """
+    Split item indices into chunks of at most LLM_PACK_MAX_ITEMS items whose
+    packed prompt stays within LLM_PACK_PROMPT_TOKENS.
+    """
+    chunks, chunk, chunk_len = [], [], base_len
+    for idx in indices:
+        block_len = len(item_blocks[idx])
+        if chunk and (len(chunk) >= LLM_PACK_MAX_ITEMS
+                      or (chunk_len + block_len) // 4 > LLM_PACK_PROMPT_TOKENS):
+            chunks.append(chunk)
+            chunk, chunk_len = [], base_len
+        chunk.append(idx)
+        chunk_len += block_len
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def call_llm_multi(items: List[Dict], eligible_zones_per_item: List[List[str]]) -> List[Dict]:
+    """
+    Decide zones for several items with as few LLM requests as possible.
+    Items sharing the same eligible zones are packed into one prompt; any item
+    missing from the packed response goes through the single-item call_llm.
+    Returns one call_llm-style result per item, in input order.
+    """
+    logger.debug("call_llm_multi() invoked for %d items", len(items))
+
+    backend = _llm_backend()
+    if backend is None:
+        return [rule_based_selection(item, zones) for item, zones in zip(items, eligible_zones_per_item)]
+
+    base_url, api_key, model = backend
+    client = _get_client(base_url, api_key)
+    results: List = [None] * len(items)
+
+    # Group by eligibility so the shared AVAILABLE ZONES block stays valid
+    groups: Dict[frozenset, List[int]] = {}
+    for idx, zones in enumerate(eligible_zones_per_item):
+        groups.setdefault(frozenset(zones), []).append(idx)
+
+    for zone_set, indices in groups.items():
+        if not zone_set:
+            # Nothing to offer the LLM; call_llm returns the per-item error
+            for idx in indices:
+                results[idx] = call_llm(items[idx], [])
+            continue
+        zones_desc = _ZONES_DESC_CACHE[zone_set]
+        eligible = [z for z in ZONES if z in zone_set]
+        item_blocks = {idx: _PROMPT_BATCH_ITEM.format(**items[idx], n=LLM_PACK_MAX_ITEMS) for idx in indices}
+        base_len = len(_PROMPT_BATCH) + len(zones_desc)
+
+        for chunk in _pack_chunks(indices, item_blocks, base_len):
+            prompt = _PROMPT_BATCH.format(
+                items_desc="\n".join(_PROMPT_BATCH_ITEM.format(**items[idx], n=n)
+                                     for n, idx in enumerate(chunk, 1)),
+                zones_desc=zones_desc
+            )
+            try:
+                logger.debug("Calling LLM API: %s (%d items)", model, len(chunk))
+                start = time.perf_counter()
+                text = _complete(client, model, [
+                    {"role": "system", "content": _SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ], LLM_MAX_TOKENS * len(chunk)) or ""
+                decision_time = time.perf_counter() - start
+                logger.info("LLM replied in %.2fs", decision_time)
+            except Exception as e:
+                logger.warning("Packed request failed (%s: %s) - retrying items individually", type(e).__name__, e)
+                text, decision_time = "", 0
+
+            for match in _RE_BATCH_ITEM.finditer(text):
+                n = int(match.group(1))
+                zone = match.group(2).upper()
+                if not 1 <= n <= len(chunk) or zone not in zone_set or results[chunk[n - 1]] is not None:
+                    continue
+                idx = chunk[n - 1]
+                results[idx] = {
+                    'zone': zone,
+                    'confidence': match.group(3).lower(),
+                    'reasoning': ' '.join(match.group(4).split()),
+                    'decision_time': decision_time,
+                    'success': True,
+                    'llm_backend': 'Ollama (phi3:mini)' if USE_OLLAMA else 'OpenRouter (Mistral-7B)',
+                    'llm_model': model
+                }
+
+            missing = [idx for idx in chunk if results[idx] is None]
+            if missing:
+                logger.warning("Could not parse %d of %d packed items - using single-item calls", len(missing), len(chunk))
+            for idx in missing:
+                results[idx] = call_llm(items[idx], eligible)
+
+    return results
+
 # ============================================================================
 # MAIN AGENT FUNCTION
 # ============================================================================
 
-def run_agent(item: Dict) -> Dict:
+def _llm_zones(rules_result: Dict) -> List[str]:
     """
-    Complete agent pipeline: Rules → LLM → Validation → Response
+    Zones offered to the LLM: only the mandatory zone when a safety rule fixed it.
     """
-    start_time = time.time()
+    if rules_result['mandatory_zone']:
+        return [rules_result['mandatory_zone']]
+    return rules_result['eligible_zones']
 
-    # Step 1: Apply safety rules
-    rules_result = apply_safety_rules(item)
+def _templated_result(item: Dict, rules_result: Dict):
+    """
+    Templated reasoning for a mandatory zone, or None when the LLM is needed.
+    """
+    if rules_result['mandatory_zone'] and not LLM_EXPLAIN_MANDATORY:
+        return _mandatory_reasoning(item, rules_result['mandatory_zone'])
+    return None
+
+def _assemble_result(rules_result: Dict, llm_result: Dict) -> Dict:
+    """
+    Merge rule-engine output and the LLM decision into the UI result dict.
+    """
+    # Check if LLM failed
+    if not llm_result.get('success', True):
+        return {
+            'success': False,
+            'error': llm_result.get('error', 'Unknown error occurred'),
+            'safety_checks': rules_result['safety_checks'],
+            'rejected_zones': rules_result['rejected_zones'],
+            'eligible_zones': rules_result['eligible_zones']
+        }
 
-    # Step 2: Always call LLM for reasoning, even for mandatory assignments
     if rules_result['mandatory_zone']:
-        # Mandatory zone - zone is predetermined but LLM explains why
+        # Mandatory zone - zone is predetermined, reasoning explains why
         zone = rules_result['mandatory_zone']
         confidence = 'high'
         mandatory = True
-
-        # Still call LLM to get contextual reasoning for the mandatory assignment
-        llm_result = call_llm(item, [zone])  # Pass only the mandatory zone
-
-        # Check if LLM failed
-        if not llm_result.get('success', True):
-            return {
-                'success': False,
-                'error': llm_result.get('error', 'Unknown error occurred'),
-                'safety_checks': rules_result['safety_checks'],
-                'rejected_zones': rules_result['rejected_zones'],
-                'eligible_zones': rules_result['eligible_zones']
-            }
-
-        reasoning = llm_result['reasoning']
-        decision_time = llm_result['decision_time']
     else:
         # LLM-based decision for operational optimization
-        llm_result = call_llm(item, rules_result['eligible_zones'])
-
-        # Check if LLM failed
-        if not llm_result.get('success', True):
-            return {
-                'success': False,
-                'error': llm_result.get('error', 'Unknown error occurred'),
-                'safety_checks': rules_result['safety_checks'],
-                'rejected_zones': rules_result['rejected_zones'],
-                'eligible_zones': rules_result['eligible_zones']
-            }
-
         zone = llm_result['zone']
         confidence = llm_result['confidence']
-        reasoning = llm_result['reasoning']
-        decision_time = llm_result['decision_time']
         mandatory = False
 
-    # Calculate total time
-    total_time = time.time() - start_time
-
     return {
         'success': True,
         'zone': zone,
         'zone_name': ZONES[zone]['name'],
-        'zone_details': ZONES[zone],
+        'zone_details': dict(ZONES[zone]),
         'confidence': confidence,
-        'reasoning': reasoning,
-        'decision_time': round(decision_time, 3),
+        'reasoning': llm_result['reasoning'],
+        'decision_time': round(llm_result['decision_time'], 3),
         'safety_checks': rules_result['safety_checks'],
         'rejected_zones': rules_result['rejected_zones'],
         'mandatory': mandatory,
         'eligible_zones': rules_result['eligible_zones']
     }
 
+def _decision_key(item: Dict, eligible_zones: List[str]) -> tuple:
+    """
+    Key for a memoized LLM zone decision: the item profile with weight
+    bucketed to 1 kg, plus the eligible zones, which come from the exact
+    weight so a bucket never spans a rack limit. The product name stays in
+    the key because the reasoning refers to it.
+    """
+    return (item['product_name'], item['category'], round(item['weight']), item['hazard_class'],
+            item['temperature_req'], item['turnover_rate'], tuple(eligible_zones))
+
+@st.cache_resource(show_spinner=False)
+def _decision_memo() -> _Memo:
+    """Process-wide memo of successful LLM zone decisions."""
+    return _Memo(LLM_MEMO_SIZE, LLM_DECISION_TTL)
+
+def run_agent(item: Dict, on_token=None) -> Dict:
+    """
+    Complete agent pipeline: Rules → LLM → Validation → Response
+
+    LLM decisions are memoized per item profile (_decision_memo; the SKU is
+    not part of the key), so repeat requests for the same product skip the
+    LLM call. With on_token, the LLM reply is streamed to it as it arrives,
+    called as on_token(delta, eligible_zones=<zones offered to the LLM>).
+    """
+    # Step 1: Apply safety rules (always on the exact item)
+    rules_result = apply_safety_rules(item)
+
+    # Step 2: Mandatory zones use templated reasoning unless LLM_EXPLAIN_MANDATORY is set;
+    # otherwise reuse the decision for a matching item profile, or ask the LLM
+    llm_result = _templated_result(item, rules_result)
+    if llm_result is None:
+        eligible_zones = _llm_zones(rules_result)
+        key = _decision_key(item, eligible_zones)
+        start = time.perf_counter()
+        llm_result = _decision_memo().get(key)
+        if llm_result is not None:
+            # Report the lookup, not the original LLM round-trip
+            llm_result = dict(llm_result, decision_time=time.perf_counter() - start)
+        else:
+            if on_token is not None:
+                on_token = functools.partial(on_token, eligible_zones=eligible_zones)
+            llm_result = call_llm(item, eligible_zones, on_token)
+            # Rule-based fallbacks carry no llm_model and are not reused
+            if llm_result['success'] and 'llm_model' in llm_result:
+                _decision_memo().put(key, llm_result)
+
+    return _assemble_result(rules_result, llm_result)
+
+async def _run_all(items: List[Dict]) -> List[Dict]:
+    """
+    Apply safety rules to every item, then issue all LLM calls concurrently.
+    """
+    rules_results = apply_safety_rules_batch(items)
+    llm_results = [_templated_result(item, rules) for item, rules in zip(items, rules_results)]
+    pending = [idx for idx, res in enumerate(llm_results) if res is None]
+
+    if not pending:
+        return [_assemble_result(rules, llm) for rules, llm in zip(rules_results, llm_results)]
+
+    backend = _llm_backend()
+    if backend is None:
+        for idx in pending:
+            llm_results[idx] = rule_based_selection(items[idx], _llm_zones(rules_results[idx]))
+    else:
+        base_url, api_key, model = backend
+        # The async client is bound to this event loop, so it lives for one batch
+        async with AsyncOpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+                timeout=30.0
+            )
+        ) as client:
+            semaphore = asyncio.Semaphore(LLM_BATCH_CONCURRENCY)
+            responses = await asyncio.gather(*[
+                _call_llm_async(client, model, items[idx], _llm_zones(rules_results[idx]), semaphore)
+                for idx in pending
+            ])
+        for idx, res in zip(pending, responses):
+            llm_results[idx] = res
+
+    return [_assemble_result(rules, llm) for rules, llm in zip(rules_results, llm_results)]
+
+def _run_packed(items: List[Dict]) -> List[Dict]:
+    """
+    Apply safety rules to every item, then pack the LLM decisions into as few
+    prompts as possible.
+    """
+    rules_results = apply_safety_rules_batch(items)
+    llm_results = [_templated_result(item, rules) for item, rules in zip(items, rules_results)]
+    pending = [idx for idx, res in enumerate(llm_results) if res is None]
+
+    if pending:
+        responses = call_llm_multi([items[idx] for idx in pending],
+                                   [_llm_zones(rules_results[idx]) for idx in pending])
+        for idx, res in zip(pending, responses):
+            llm_results[idx] = res
+
+    return [_assemble_result(rules, llm) for rules, llm in zip(rules_results, llm_results)]
+
+def run_agent_batch(items: List[Dict], pack: bool = False) -> List[Dict]:
+    """
+    Multi-item put-away: same pipeline as run_agent, with the LLM round-trips
+    for all items in flight at once. With pack=True, items are instead packed
+    several per prompt (call_llm_multi), which needs far fewer requests when
+    provider rate limits are the bottleneck. Results are returned in input order.
+    """
+    if pack:
+        return _run_packed(items)
+    return asyncio.run(_run_all(items))
+
 # ============================================================================
 # CUSTOM CSS 
 # ============================================================================
 
-st.markdown("""
-<style>
-    /* Hide Streamlit branding */
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-    
-    /* Main container */
-    .main .block-container {
-        padding-top: 2rem;
-        padding-bottom: 2rem;
-        max-width: 1400px;
-    }
-    
-    /* Header */
-    .main-header {
-        background: linear-gradient(135deg, #1e3c72 0%, #2a5298 100%);
-        padding: 1.8rem 2rem;
-        border-radius: 12px;
-        color: white;
-        text-align: center;
-        margin-bottom: 2rem;
-        box-shadow: 0 8px 32px rgba(0, 0, 0, 0.15);
-    }
-    
-    .main-header h1 {
-        margin: 0;
-        font-size: 2.2rem;
-        font-weight: 700;
-        letter-spacing: -0.5px;
-    }
-    
-    .main-header p {
-        margin: 0.5rem 0 0 0;
-        font-size: 1rem;
-        opacity: 0.9;
-    }
-    
-    .status-badge {
-        display: inline-block;
-        background: rgba(255,255,255,0.2);
-        padding: 0.3rem 1rem;
-        border-radius: 20px;
-        font-size: 0.85rem;
-        margin-top: 0.8rem;
-    }
-    
-    /* Cards */
-    .card {
-        background: #ffffff;
-        padding: 1.5rem;
-        border-radius: 12px;
-        box-shadow: 0 2px 12px rgba(0, 0, 0, 0.08);
-        border: 1px solid #e8e8e8;
-        height: 100%;
-    }
-    
-    .card-header {
-        font-size: 1.15rem;
-        font-weight: 600;
-        color: #1e3c72;
-        margin-bottom: 1rem;
-        padding-bottom: 0.75rem;
-        border-bottom: 2px solid #1e3c72;
-        display: flex;
-        align-items: center;
-        gap: 0.5rem;
-    }
-    
-    /* Zone Display */
-    .zone-display {
-        background: linear-gradient(135deg, #00b09b 0%, #96c93d 100%);
-        color: white;
-        padding: 1.8rem;
-        border-radius: 12px;
-        text-align: center;
-        margin: 1rem 0;
-        box-shadow: 0 6px 20px rgba(0, 176, 155, 0.3);
-    }
-    
-    .zone-display.mandatory {
-        background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%);
-        box-shadow: 0 6px 20px rgba(245, 87, 108, 0.3);
-    }
-    
-    .zone-label {
-        font-size: 0.85rem;
-        opacity: 0.9;
-        text-transform: uppercase;
-        letter-spacing: 1px;
-    }
-    
-    .zone-code {
-        font-size: 3rem;
-        font-weight: 800;
-        margin: 0.3rem 0;
-        text-shadow: 0 2px 4px rgba(0,0,0,0.1);
-    }
-    
-    .zone-name {
-        font-size: 1.1rem;
-        opacity: 0.95;
-    }
-    
-    /* Badges */
-    .badge {
-        display: inline-block;
-        padding: 0.4rem 1rem;
-        border-radius: 20px;
-        font-weight: 600;
-        font-size: 0.8rem;
-        margin: 0.3rem;
-    }
-    
-    .badge-high { background: #d4edda; color: #155724; }
-    .badge-medium { background: #fff3cd; color: #856404; }
-    .badge-low { background: #f8d7da; color: #721c24; }
-    .badge-time { background: #1e3c72; color: white; }
-    .badge-mandatory { background: #f5576c; color: white; }
-    
-    /* Safety Checks */
-    .safety-item {
-        padding: 0.6rem 0.8rem;
-        margin: 0.4rem 0;
-        border-radius: 8px;
-        font-size: 0.9rem;
-        display: flex;
-        align-items: center;
-        gap: 0.5rem;
-    }
-    
-    .safety-item.passed {
-        background: linear-gradient(90deg, #d4edda 0%, #f8f9fa 100%);
-        border-left: 4px solid #28a745;
-    }
-    
-    .safety-item.warning {
-        background: linear-gradient(90deg, #fff3cd 0%, #f8f9fa 100%);
-        border-left: 4px solid #ffc107;
-    }
-    
-    .safety-item .icon { font-size: 1.1rem; }
-    .safety-item .text { flex: 1; }
-    .safety-item .label { font-weight: 600; color: #333; }
-    .safety-item .detail { font-size: 0.8rem; color: #666; margin-top: 2px; }
-    
-    /* Reasoning Box */
-    .reasoning-box {
-        background: linear-gradient(135deg, #f8f9fa 0%, #e9ecef 100%);
-        padding: 1rem 1.2rem;
-        border-radius: 10px;
-        border-left: 4px solid #1e3c72;
-        margin: 1rem 0;
-        font-size: 0.95rem;
-        line-height: 1.6;
-        color: #333;
-    }
-    
-    /* Rejected Zones */
-    .rejected-zone {
-        background: #fff5f5;
-        padding: 0.5rem 0.8rem;
-        margin: 0.3rem 0;
-        border-radius: 6px;
-        border-left: 3px solid #dc3545;
-        font-size: 0.85rem;
-    }
-    
-    .rejected-zone .zone-id { font-weight: 700; color: #dc3545; }
-    .rejected-zone .reason { color: #666; }
-    
-    /* Override Section */
-    .override-section {
-        background: linear-gradient(135deg, #fff9e6 0%, #fff3cd 100%);
-        padding: 1.2rem 1.5rem;
-        border-radius: 12px;
-        border: 2px solid #ffc107;
-        margin: 1.5rem 0;
-    }
-    
-    .override-section h3 {
-        margin: 0 0 1rem 0;
-        color: #856404;
-        font-size: 1.1rem;
-    }
-    
-    /* Audit Log */
-    .audit-header {
-        background: #1e3c72;
-        color: white;
-        padding: 0.6rem 1rem;
-        border-radius: 8px 8px 0 0;
-        font-weight: 600;
-        font-size: 0.9rem;
-    }
-    
-    .audit-row {
-        padding: 0.6rem 1rem;
-        border-bottom: 1px solid #eee;
-        font-size: 0.85rem;
-        display: flex;
-        align-items: center;
-    }
-    
-    .audit-row:nth-child(even) { background: #f8f9fa; }
-    .audit-row:hover { background: #e9ecef; }
-    
-    /* Buttons */
-    .stButton > button {
-        background: linear-gradient(135deg, #1e3c72 0%, #2a5298 100%);
-        color: white;
-        border: none;
-        padding: 0.75rem 2rem;
-        font-size: 1rem;
-        font-weight: 600;
-        border-radius: 8px;
-        box-shadow: 0 4px 12px rgba(30, 60, 114, 0.3);
-        transition: all 0.3s ease;
-        width: 100%;
-    }
-    
-    .stButton > button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 6px 20px rgba(30, 60, 114, 0.4);
-    }
-    
-    /* Zone Details */
-    .zone-detail {
-        font-size: 0.8rem;
-        color: #666;
-        margin-top: 0.5rem;
-        padding: 0.5rem;
-        background: #f8f9fa;
-        border-radius: 6px;
-    }
-    
-    .zone-detail-item {
-        display: flex;
-        justify-content: space-between;
-        padding: 0.2rem 0;
-    }
-</style>
-""", unsafe_allow_html=True)
+# The stylesheet is kept in its own file for editing
+CSS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'app.css')
+
+@st.cache_resource(show_spinner=False)
+def _inject_css() -> str:
+    """
+    The stylesheet as a <style> block, read and minified once per process.
+    It is still emitted on every rerun (Streamlit drops elements a rerun
+    does not re-send), so keeping the payload small is what saves work.
+    """
+    with open(CSS_PATH, encoding='utf-8') as f:
+        css = f.read()
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    return '<style>' + re.sub(r'\s*([{};:,])\s*', r'\1', css).strip() + '</style>'
+
+st.markdown(_inject_css(), unsafe_allow_html=True)
+
+# Row templates for the safety card, joined into one payload per render
+SAFETY_TPL = ('<div class="safety-item {cls}"><span class="icon">{icon}</span>'
+              '<div class="text"><div class="label">{label}</div><div class="detail">{msg}</div></div></div>')
+REJECTED_TPL = ('<div class="rejected-zone"><span class="zone-id">Zone {zone}</span>: '
+                '<span class="reason">{reason}</span></div>')
+
+# Recommendation card fragments
+ZONE_DISPLAY_TPL = ('<div class="zone-display {zone_class}"><div class="zone-label">Recommended Zone</div>'
+                    '<div class="zone-code">ZONE {zone}</div><div class="zone-name">{zone_name}</div></div>')
+ZONE_DETAIL_TPL = ('<div class="zone-detail">'
+                   '<div class="zone-detail-item"><span>Rack Type:</span><span>{rack_type}</span></div>'
+                   '<div class="zone-detail-item"><span>Max Weight:</span><span>{max_weight}kg</span></div>'
+                   '<div class="zone-detail-item"><span>Temperature:</span><span>{temp_range}</span></div>'
+                   '<div class="zone-detail-item"><span>Dispatch Distance:</span><span>{dispatch_distance}m</span></div>'
+                   '<div class="zone-detail-item"><span>Equipment:</span><span>{equipment}</span></div>'
+                   '</div>')
+REASONING_TPL = ('<div style="font-weight: 600; margin-top: 1.2rem; color: #1e3c72;">🧠 Decision Reasoning</div>'
+                 '<div class="reasoning-box">{}</div>')
+
+# Recommendation badges; confidence is always one of these three levels
+BADGE_HTML = {
+    level: f'<span class="badge badge-{level}">⚡ {level.upper()} CONFIDENCE</span>'
+    for level in ('high', 'medium', 'low')
+}
+TIME_BADGE_FMT = '<span class="badge badge-time">🕐 {}s</span>'
+MANDATORY_BADGE = "<span class='badge badge-mandatory'>🔒 SAFETY RULE</span>"
+BACKEND_BADGE_FMT = '<span class="badge" style="background: #667eea; color: white;">🤖 {}</span>'
+
+# ============================================================================
+# AUDIT TRAIL (CSV)
+# ============================================================================
+
+# Every decision and override is appended here; the session keeps only the
+# rows it displays
+AUDIT_CSV_PATH = os.environ.get('PUTAWAY_AUDIT_CSV', os.path.join(os.path.expanduser('~'), 'putaway_audit.csv'))
+AUDIT_CSV_FIELDS = ('timestamp', 'event', 'item_id', 'product', 'ai_zone', 'final_zone',
+                    'confidence', 'mandatory', 'override_reason')
+
+def _csv_cell(value):
+    """Cell value that a spreadsheet will not evaluate as a formula."""
+    if isinstance(value, str) and value[:1] in ('=', '+', '-', '@', '\t', '\r'):
+        return "'" + value
+    return value
+
+class _AuditWriter:
+    """Append-only CSV audit trail shared by all sessions, flushed per row."""
+
+    def __init__(self, path: str):
+        write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._fh = open(path, 'a', newline='', buffering=1, encoding='utf-8')
+        self._writer = csv.writer(self._fh)
+        self._lock = threading.Lock()
+        if write_header:
+            self._writer.writerow(AUDIT_CSV_FIELDS)
+
+    def write(self, event: str, entry: Dict):
+        row = [datetime.now().isoformat(timespec='seconds'), event]
+        row.extend(_csv_cell(entry.get(field, '')) for field in AUDIT_CSV_FIELDS[2:])
+        with self._lock:
+            self._writer.writerow(row)
+
+@st.cache_resource(show_spinner=False)
+def _audit_writer():
+    """Process-wide audit writer, or None when the file cannot be opened."""
+    try:
+        return _AuditWriter(AUDIT_CSV_PATH)
+    except OSError as e:
+        logger.warning("Audit CSV unavailable (%s) - decisions are not persisted", e)
+        return None
+
+def record_audit(event: str, entry: Dict):
+    """Append a 'decision' or 'override' audit entry to the CSV trail."""
+    writer = _audit_writer()
+    if writer is not None:
+        writer.write(event, entry)
 
 # ============================================================================
 # SESSION STATE
 # ============================================================================
 
+# The five most recent decisions, newest first, for the audit table
 if 'audit_log' not in st.session_state:
-    st.session_state.audit_log = []
+    st.session_state.audit_log = deque(maxlen=5)
 if 'last_result' not in st.session_state:
     st.session_state.last_result = None
 if 'last_item' not in st.session_state:
     st.session_state.last_item = None
+if 'last_item_hash' not in st.session_state:
+    st.session_state.last_item_hash = None
+
+def _new_sku() -> str:
+    """Default Item ID, stamped with the current time."""
+    return f"SKU-{datetime.now():%y%m%d-%H%M%S}"
+
+def _renew_sku():
+    """
+    on_change for the item attribute inputs: once they differ from the last
+    decision, the next item gets a fresh SKU, unless the operator has edited
+    it. Until then a repeat click resubmits the same item.
+    """
+    decided_sku = st.session_state.pop('decided_sku', None)
+    if decided_sku is not None and st.session_state.item_sku == decided_sku:
+        st.session_state.item_sku = _new_sku()
+
+# The Item ID input is keyed on item_sku, so its default is pinned (a
+# per-second value= would rebuild the widget and drop what was typed) and
+# only renewed by _renew_sku
+if 'item_sku' not in st.session_state:
+    st.session_state.item_sku = _new_sku()
+
+# ============================================================================
+# SIDEBAR
+# ============================================================================
+
+with st.sidebar:
+    st.caption(f"Recommendations are reused per product profile for {LLM_DECISION_TTL // 3600} hour, "
+               f"and identical LLM prompts for {LLM_DISK_CACHE_TTL // 86400} days")
+    if st.button("🧹 Clear cache", key="clear_cache"):
+        _decision_memo().clear()
+        _reply_memo().clear()
+        st.success("✅ Recommendation cache cleared")
 
 # ============================================================================
 # HEADER
 # ============================================================================
 
-current_time = datetime.now().strftime("%H:%M:%S")
-st.markdown(f"""
+st.html("""
 <div class="main-header">
     <h1>AGENTIC AI PUT-AWAY DECISION SYSTEM</h1>
     <p>Real-time storage location recommendation with safety guarantees</p>
 </div>
-""", unsafe_allow_html=True)
+""")
 
 # ============================================================================
 # MAIN LAYOUT
@@ -992,17 +1666,17 @@ col1, col2, col3 = st.columns([1, 1.2, 1])
 # COLUMN 1: INCOMING ITEM INPUT
 # ──────────────────────────────────────────────────────────────────────────
 
-with col1:
-    st.markdown("""
-    <div class="card">
-        <div class="card-header">📦 Incoming Item</div>
-    """, unsafe_allow_html=True)
-    
+@st.fragment
+def _input_card():
+    """
+    Item input form. Edits rerun only this fragment; GET RECOMMENDATION
+    queues the item and reruns the whole app, which processes it.
+    """
     st.caption("WMS / Operator Input")
     
     item_id = st.text_input(
         "Item ID / SKU",
-        value=f"SKU-{datetime.now().strftime('%y%m%d-%H%M%S')}",
+        key="item_sku",
         help="Unique identifier for tracking"
     )
 
@@ -1011,55 +1685,56 @@ with col1:
         "Product Name",
         options=list(PRODUCT_CATALOG.keys()),
         index=0,
-        help="Select from predefined product catalog"
+        help="Select from predefined product catalog",
+        on_change=_renew_sku
     )
 
     # Get product defaults from catalog
-    product_defaults = PRODUCT_CATALOG.get(product_name, {})
+    product_defaults = _PRODUCT_DEFAULTS[product_name]
 
     category = st.selectbox(
         "Category",
-        ["Electronics", "Frozen Food", "Chemicals", "Machinery",
-         "Pharmaceuticals", "Textiles", "Automotive", "General Goods"],
-        index=["Electronics", "Frozen Food", "Chemicals", "Machinery",
-               "Pharmaceuticals", "Textiles", "Automotive", "General Goods"].index(product_defaults.get("category", "Electronics")),
-        help="Product category for analytics"
+        CATEGORY_OPTIONS,
+        index=product_defaults['category_index'],
+        help="Product category for analytics",
+        on_change=_renew_sku
     )
 
     weight = st.number_input(
         "Weight (kg)",
         min_value=0.1,
         max_value=3000.0,
-        value=float(product_defaults.get("weight", 45.0)),
+        value=product_defaults['weight'],
         step=0.5,
-        help="Total item weight including packaging"
+        help="Total item weight including packaging",
+        on_change=_renew_sku
     )
 
-    hazard_options = ["none", "flammable", "corrosive", "toxic", "explosive", "oxidizer"]
     hazard_class = st.selectbox(
         "Hazard Classification",
-        hazard_options,
-        index=hazard_options.index(product_defaults.get("hazard", "none")),
-        help="UN hazard classification if applicable"
+        HAZARD_OPTIONS,
+        index=product_defaults['hazard_index'],
+        help="UN hazard classification if applicable",
+        on_change=_renew_sku
     )
 
-    temp_options = ["ambient", "cold", "frozen", "chilled", "controlled"]
     temperature_req = st.selectbox(
         "Temperature Requirement",
-        temp_options,
-        index=temp_options.index(product_defaults.get("temp", "ambient")),
-        help="Storage temperature requirement"
+        TEMP_OPTIONS,
+        index=product_defaults['temp_index'],
+        help="Storage temperature requirement",
+        on_change=_renew_sku
     )
 
-    turnover_options = ["low", "medium", "high"]
     turnover_rate = st.selectbox(
         "Turnover Rate",
-        turnover_options,
-        index=turnover_options.index(product_defaults.get("turnover", "medium")),
-        help="Expected pick frequency"
+        TURNOVER_OPTIONS,
+        index=product_defaults['turnover_index'],
+        help="Expected pick frequency",
+        on_change=_renew_sku
     )
 
-    st.markdown("<div style='height: 0.5rem'></div>", unsafe_allow_html=True)
+    st.html("<div style='height: 0.5rem'></div>")
 
     # Validate inputs and show warnings
     warnings = validate_item_inputs(category, temperature_req, hazard_class)
@@ -1067,29 +1742,59 @@ with col1:
         for warning in warnings:
             st.warning(warning, icon="⚠️")
 
-    st.markdown("<div style='height: 0.5rem'></div>", unsafe_allow_html=True)
-
-    recommend_btn = st.button("🚀 GET RECOMMENDATION", use_container_width=True)
+    st.html("<div style='height: 0.5rem'></div>")
+
+    if st.button("🚀 GET RECOMMENDATION", use_container_width=True):
+        st.session_state.pending_item = {
+            'item_id': item_id,
+            'product_name': product_name,
+            'category': category,
+            'weight': weight,
+            'hazard_class': hazard_class,
+            'temperature_req': temperature_req,
+            'turnover_rate': turnover_rate
+        }
+        st.rerun()
 
-    st.markdown("</div>", unsafe_allow_html=True)
+with col1:
+    # Widgets cannot sit inside HTML, so the card shell is just its header
+    st.html('<div class="card"><div class="card-header">📦 Incoming Item</div></div>')
+    
+    _input_card()
 
 # ──────────────────────────────────────────────────────────────────────────
 # PROCESS RECOMMENDATION
 # ──────────────────────────────────────────────────────────────────────────
 
-if recommend_btn:
-    item = {
-        'item_id': item_id,
-        'product_name': product_name,
-        'category': category,
-        'weight': weight,
-        'hazard_class': hazard_class,
-        'temperature_req': temperature_req,
-        'turnover_rate': turnover_rate
-    }
+def _item_digest(item: Dict) -> str:
+    """Digest of the submitted inputs, to spot repeat clicks."""
+    return hashlib.blake2b(repr(sorted(item.items())).encode(), digest_size=8).hexdigest()
+
+# Full-app rerun queued by the input card, so results can stream into col2
+item = st.session_state.pop('pending_item', None)
+item_hash = _item_digest(item) if item else None
+# A repeat click with unchanged inputs keeps the result already on screen
+if item_hash and item_hash == st.session_state.last_item_hash:
+    item = None
+if item:
+    # Stream the zone and reasoning into the recommendation column as they arrive
+    with col2:
+        live_reply = st.empty()
+    reply_parser = _ReplyParser()
+
+    def _show_partial_reply(delta: str, eligible_zones: List[str]):
+        reply_parser.feed(delta)
+        # An ineligible zone is replaced once the reply is parsed; never show it
+        if reply_parser.zone in eligible_zones:
+            live_reply.html(f"""
+            <div class="zone-label">Recommended Zone</div>
+            <div class="zone-code">ZONE {reply_parser.zone}</div>
+            <div class="reasoning-box">{reply_parser.reasoning_so_far()}</div>
+            """)
 
     with st.spinner("🔄 Analyzing item attributes..."):
-        result = run_agent(item)
+        result = run_agent(item, on_token=_show_partial_reply)
+        live_reply.empty()
 
         # Check if LLM failed
         if not result.get('success', True):
@@ -1099,11 +1804,13 @@ if recommend_btn:
         else:
             st.session_state.last_result = result
             st.session_state.last_item = item
+            st.session_state.last_item_hash = item_hash
+            st.session_state.decided_sku = item['item_id']
 
             # Add to audit log only on success
-            st.session_state.audit_log.insert(0, {
-                'item_id': item_id,
-                'product': product_name[:20],
+            st.session_state.audit_log.appendleft({
+                'item_id': item['item_id'],
+                'product': item['product_name'],
                 'ai_zone': result['zone'],
                 'final_zone': result['zone'],
                 'overridden': False,
@@ -1111,133 +1818,87 @@ if recommend_btn:
                 'confidence': result['confidence'],
                 'mandatory': result['mandatory']
             })
+            record_audit('decision', st.session_state.audit_log[0])
 
 # ──────────────────────────────────────────────────────────────────────────
 # COLUMN 2: AI RECOMMENDATION
 # ──────────────────────────────────────────────────────────────────────────
 
 with col2:
-    st.markdown("""
-    <div class="card">
-        <div class="card-header">🤖 AI Recommendation</div>
-    """, unsafe_allow_html=True)
-    
     if st.session_state.last_result:
         r = st.session_state.last_result
-        
-        # Zone Display
-        zone_class = "mandatory" if r['mandatory'] else ""
-        st.markdown(f"""
-        <div class="zone-display {zone_class}">
-            <div class="zone-label">Recommended Zone</div>
-            <div class="zone-code">ZONE {r['zone']}</div>
-            <div class="zone-name">{r['zone_name']}</div>
-        </div>
-        """, unsafe_allow_html=True)
+        zone, zone_name, confidence, mandatory, decision_time, reasoning, zone_details = (
+            r[k] for k in ('zone', 'zone_name', 'confidence', 'mandatory', 'decision_time', 'reasoning', 'zone_details')
+        )
         
         # Badges
-        conf_class = f"badge-{r['confidence']}"
-        backend_info = r.get('llm_backend', 'Unknown')
-        st.markdown(f"""
-        <div style="text-align: center; margin: 1rem 0;">
-            <span class="badge {conf_class}">⚡ {r['confidence'].upper()} CONFIDENCE</span>
-            <span class="badge badge-time">🕐 {r['decision_time']}s</span>
-            {"<span class='badge badge-mandatory'>🔒 SAFETY RULE</span>" if r['mandatory'] else ""}
-            <span class="badge" style="background: #667eea; color: white;">🤖 {backend_info}</span>
-        </div>
-        """, unsafe_allow_html=True)
+        badges = [BADGE_HTML[confidence], TIME_BADGE_FMT.format(decision_time)]
+        if mandatory:
+            badges.append(MANDATORY_BADGE)
+        badges.append(BACKEND_BADGE_FMT.format(r.get('llm_backend', 'Unknown')))
         
-        # Zone Details
-        zd = r['zone_details']
-        st.markdown(f"""
-        <div class="zone-detail">
-            <div class="zone-detail-item"><span>Rack Type:</span><span>{zd['rack_type']}</span></div>
-            <div class="zone-detail-item"><span>Max Weight:</span><span>{zd['max_weight']}kg</span></div>
-            <div class="zone-detail-item"><span>Temperature:</span><span>{zd['temp_range']}</span></div>
-            <div class="zone-detail-item"><span>Dispatch Distance:</span><span>{zd['dispatch_distance']}m</span></div>
-            <div class="zone-detail-item"><span>Equipment:</span><span>{zd['equipment']}</span></div>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        # Reasoning
-        st.markdown(f"""
-        <div style="font-weight: 600; margin-top: 1.2rem; color: #1e3c72;">🧠 Decision Reasoning</div>
-        <div class="reasoning-box">{r['reasoning']}</div>
-        """, unsafe_allow_html=True)
+        # Zone display, badges, zone details and reasoning
+        body = [
+            ZONE_DISPLAY_TPL.format(zone_class="mandatory" if mandatory else "", zone=zone, zone_name=zone_name),
+            f'<div style="text-align: center; margin: 1rem 0;">{" ".join(badges)}</div>',
+            ZONE_DETAIL_TPL.format_map(zone_details),
+            REASONING_TPL.format(reasoning)
+        ]
         
     else:
-        st.markdown("""
-        <div style="text-align: center; padding: 3rem; color: #999;">
-            <div style="font-size: 4rem; margin-bottom: 1rem;">📋</div>
-            <div style="font-size: 1.1rem;">Enter item details and click</div>
-            <div style="font-size: 1.1rem; font-weight: 600;">"GET RECOMMENDATION"</div>
-        </div>
-        """, unsafe_allow_html=True)
+        body = [
+            '<div style="text-align: center; padding: 3rem; color: #999;">'
+            '<div style="font-size: 4rem; margin-bottom: 1rem;">📋</div>'
+            '<div style="font-size: 1.1rem;">Enter item details and click</div>'
+            '<div style="font-size: 1.1rem; font-weight: 600;">"GET RECOMMENDATION"</div>'
+            '</div>'
+        ]
     
-    st.markdown("</div>", unsafe_allow_html=True)
+    # The whole card is one element
+    st.html(f'<div class="card"><div class="card-header">🤖 AI Recommendation</div>{"".join(body)}</div>')
 
 # ──────────────────────────────────────────────────────────────────────────
 # COLUMN 3: SAFETY VALIDATION
 # ──────────────────────────────────────────────────────────────────────────
 
+# Nothing to validate until the first recommendation; col2 shows the placeholder
 with col3:
-    st.markdown("""
-    <div class="card">
-        <div class="card-header">🛡️ Safety Validation</div>
-    """, unsafe_allow_html=True)
-
     if st.session_state.last_result:
         r = st.session_state.last_result
         
         # Safety Checks
-        for key, check in r['safety_checks'].items():
-            icon = "✅" if check['status'] else "⚠️"
-            status_class = "passed" if check['status'] else "warning"
-            label = key.replace('_', ' ').title()
-            
-            st.markdown(f"""
-            <div class="safety-item {status_class}">
-                <span class="icon">{icon}</span>
-                <div class="text">
-                    <div class="label">{label}</div>
-                    <div class="detail">{check['message']}</div>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+        body = [
+            SAFETY_TPL.format(
+                cls="passed" if check['status'] else "warning",
+                icon="✅" if check['status'] else "⚠️",
+                label=key.replace('_', ' ').title(),
+                msg=check['message']
+            )
+            for key, check in r['safety_checks'].items()
+        ]
         
         # Rejected Zones
-        if r['rejected_zones']:
-            st.markdown("<div style='font-weight: 600; margin-top: 1.2rem; color: #dc3545;'>❌ Rejected Zones</div>", unsafe_allow_html=True)
-            
-            for rej in r['rejected_zones'][:4]:
-                st.markdown(f"""
-                <div class="rejected-zone">
-                    <span class="zone-id">Zone {rej['zone']}</span>: 
-                    <span class="reason">{rej['reason']}</span>
-                </div>
-                """, unsafe_allow_html=True)
-    else:
-        st.markdown("""
-        <div style="text-align: center; padding: 3rem; color: #999;">
-            <div style="font-size: 4rem; margin-bottom: 1rem;">🛡️</div>
-            <div style="font-size: 1.1rem;">Safety validation results</div>
-            <div style="font-size: 1.1rem;">will appear here</div>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    st.markdown("</div>", unsafe_allow_html=True)
+        rejected_zones = r['rejected_zones']
+        if rejected_zones:
+            body.append("<div style='font-weight: 600; margin-top: 1.2rem; color: #dc3545;'>❌ Rejected Zones</div>")
+            body.extend(REJECTED_TPL.format(zone=rej['zone'], reason=rej['reason']) for rej in rejected_zones[:4])
+        
+        st.html(f'<div class="card"><div class="card-header">🛡️ Safety Validation</div>{"".join(body)}</div>')
 
 # ============================================================================
 # HUMAN OVERRIDE SECTION
 # ============================================================================
 
-if st.session_state.last_result:
-    st.markdown("""
-    <div class="override-section">
-        <h3>👤 Human Override (Optional)</h3>
-    </div>
-    """, unsafe_allow_html=True)
-    
+@st.fragment
+def _override_section():
+    """
+    Override controls. Typing a reason reruns only this fragment; applying
+    the override reruns the app so the audit trail picks it up.
+    """
+    notice = st.session_state.pop('override_notice', None)
+    if notice:
+        st.success(f"✅ Override applied → Zone {notice}")
+
     ov_col1, ov_col2, ov_col3 = st.columns([1, 2, 1])
     
     with ov_col1:
@@ -1256,44 +1917,49 @@ if st.session_state.last_result:
         )
     
     with ov_col3:
-        st.markdown("<div style='height: 0.5rem'></div>", unsafe_allow_html=True)
+        st.html("<div style='height: 0.5rem'></div>")
         if st.button("✏️ APPLY OVERRIDE", key="apply_override"):
             if st.session_state.audit_log:
                 st.session_state.audit_log[0]['final_zone'] = override_zone
                 st.session_state.audit_log[0]['overridden'] = True
                 st.session_state.audit_log[0]['override_reason'] = override_reason
-            st.success(f"✅ Override applied → Zone {override_zone}")
-            st.balloons()
+                record_audit('override', st.session_state.audit_log[0])
+            # Full rerun so the audit trail shows the override
+            st.session_state.override_notice = override_zone
+            st.rerun()
+
+if st.session_state.last_result:
+    st.html("""
+    <div class="override-section">
+        <h3>👤 Human Override (Optional)</h3>
+    </div>
+    """)
+    
+    _override_section()
 
 # ============================================================================
 # AUDIT LOG
 # ============================================================================
 
-st.markdown("<div style='height: 2rem'></div>", unsafe_allow_html=True)
-st.markdown("### 📜 Recent Decisions (Audit Trail)")
-
 if st.session_state.audit_log:
-    # Header
-    cols = st.columns([1.5, 2, 1, 1, 1, 1])
-    cols[0].markdown("**Item ID**")
-    cols[1].markdown("**Product**")
-    cols[2].markdown("**AI Zone**")
-    cols[3].markdown("**Final**")
-    cols[4].markdown("**Override**")
-    cols[5].markdown("**Time**")
-    
-    st.markdown("<hr style='margin: 0.5rem 0; border-color: #eee;'>", unsafe_allow_html=True)
+    st.html("<div style='height: 2rem'></div>")
+    st.markdown("### 📜 Recent Decisions (Audit Trail)")
     
-    for log in st.session_state.audit_log[:5]:
-        cols = st.columns([1.5, 2, 1, 1, 1, 1])
-        cols[0].code(log['item_id'][:15], language=None)
-        cols[1].write(log.get('product', 'N/A')[:18])
-        cols[2].write(f"Zone {log['ai_zone']}")
-        
+    # One table element for the whole trail; item ID and product are operator input
+    rows = []
+    for log in st.session_state.audit_log:
         final_style = "color: #28a745; font-weight: 600;" if not log['overridden'] else "color: #ffc107; font-weight: 600;"
-        cols[3].markdown(f"<span style='{final_style}'>Zone {log['final_zone']}</span>", unsafe_allow_html=True)
-        
-        cols[4].write("✅ Yes" if log['overridden'] else "—")
-        cols[5].write(log['timestamp'])
-else:
-    st.info("📋 No decisions logged yet. Process your first item to see the audit trail.")
+        rows.append(
+            f"<tr><td><code>{html.escape(log['item_id'][:15])}</code></td>"
+            f"<td>{html.escape(log.get('product', 'N/A')[:18])}</td>"
+            f"<td>Zone {log['ai_zone']}</td>"
+            f"<td style='{final_style}'>Zone {log['final_zone']}</td>"
+            f"<td>{'✅ Yes' if log['overridden'] else '—'}</td>"
+            f"<td>{log['timestamp']}</td></tr>"
+        )
+    
+    st.html(
+        "<table class='audit'><thead><tr><th>Item ID</th><th>Product</th><th>AI Zone</th>"
+        "<th>Final</th><th>Override</th><th>Time</th></tr></thead>"
+        f"<tbody>{''.join(rows)}</tbody></table>"
+    )